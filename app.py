@@ -3,30 +3,40 @@ Analyse Doc - Aplicação principal
 Sistema avançado de análise de documentos com IA
 Versão 2.0 - Com SmartRetriever e Diagnóstico
 """
-import tempfile
-import os
+import importlib
+import threading
+from operator import attrgetter
+import time
 import logging
-from typing import Generator, Optional
+import re
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Generator, Iterable, Optional
 import streamlit as st
-from langchain.memory import ConversationBufferMemory
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import HumanMessage, AIMessage
-
-from loaders import (
-    carrega_site,
-    carrega_youtube,
-    carrega_pdf,
-    carrega_csv,
-    carrega_txt,
-    carrega_docx
+from streamlit.runtime.scriptrunner import (
+    SCRIPT_RUN_CONTEXT_ATTR_NAME,
+    add_script_run_ctx,
+    get_script_run_ctx
 )
+from langchain.memory import ConversationBufferMemory, ConversationSummaryBufferMemory
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import trim_messages
+
 from document_memory import DocumentMemoryManager
-from config import AppConfig, ModelConfig, FileTypes, CUSTOM_CSS
+from config import (
+    AppConfig, ModelConfig, FileTypes, CUSTOM_CSS, PROVEDORES, MODELOS_POR_PROVEDOR,
+    SYSTEM_PROMPT_DOCUMENTO_GRANDE, SYSTEM_PROMPT_DOCUMENTO_PEQUENO,
+    CONTEXTO_DOCUMENTO_GRANDE, CONTEXTO_DOCUMENTO_PEQUENO,
+    PROMPT_TRECHOS, PROMPT_TRECHOS_COM_ESTRUTURA
+)
 from utils import (
     setup_logging,
     validate_api_key,
+    calculate_file_hash,
+    calculate_stream_hash,
+    count_tokens,
+    get_token_ids,
+    minify_css,
     format_document_info,
     estimate_tokens,
     estimate_cost,
@@ -36,8 +46,13 @@ from utils import (
 from diagnostico import adicionar_interface_diagnostico, DocumentDiagnostic
 from melhorias_recuperacao import SmartRetriever, integrar_smart_retriever
 
-# Configurar logging
-setup_logging()
+# Configurar logging uma única vez por processo (o script roda a cada rerun)
+@st.cache_resource(show_spinner=False)
+def _configura_logging() -> None:
+    setup_logging()
+
+
+_configura_logging()
 logger = logging.getLogger(__name__)
 
 # Configurações da interface
@@ -47,18 +62,104 @@ st.set_page_config(
     layout=AppConfig.LAYOUT
 )
 
-# Aplicar estilos personalizados
-st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
-
 # Inicializar configurações
 config = AppConfig()
 model_config = ModelConfig()
 
+# Classe de chat por provedor ("módulo:classe"), importada só quando usada
+CHAT_MODELS = {
+    'Groq': 'langchain_groq:ChatGroq',
+    'OpenAI': 'langchain_openai:ChatOpenAI'
+}
+
+# Marcador de página gerado por carrega_pdf ("--- Página N ---")
+_MARCADOR_PAGINA_RE = re.compile(r"^--- Página (\d+) ---$", re.MULTILINE)
+
+
+@st.cache_resource(show_spinner=False)
+def _estilos() -> str:
+    """CSS customizado, compactado uma única vez por processo."""
+    return minify_css(CUSTOM_CSS)
+
+
+def aplicar_estilos():
+    """
+    Injeta o CSS customizado na página.
+    
+    Precisa rodar a cada rerun: o Streamlit remove os elementos que não
+    foram emitidos na execução atual, então injetar só uma vez por sessão
+    faria os estilos sumirem na primeira interação.
+    """
+    st.markdown(_estilos(), unsafe_allow_html=True)
+
+
+def criar_memoria(llm=None):
+    """
+    Cria a memória da conversa.
+    
+    Com um LLM disponível, usa ConversationSummaryBufferMemory: quando o
+    histórico passa de MEMORY_MAX_TOKENS, as mensagens mais antigas são
+    resumidas, mantendo limitado o tamanho do prompt a cada pergunta.
+    
+    Args:
+        llm: Modelo usado para resumir o histórico (None antes de inicializar)
+        
+    Returns:
+        Memória da conversa
+    """
+    if llm is None:
+        return ConversationBufferMemory(return_messages=True, memory_key="chat_history")
+    
+    return ConversationSummaryBufferMemory(
+        llm=llm,
+        max_token_limit=config.MEMORY_MAX_TOKENS,
+        return_messages=True,
+        memory_key="chat_history"
+    )
+
+
+def conta_tokens_mensagens(mensagens: list) -> int:
+    """Conta os tokens do conteúdo de uma lista de mensagens."""
+    return sum(count_tokens(mensagem.content) for mensagem in mensagens)
+
+
+def janela_historico(memoria) -> list:
+    """
+    Seleciona o histórico enviado ao modelo: o resumo acumulado (se houver)
+    seguido dos últimos MEMORY_WINDOW_TURNS turnos, limitado também a
+    HISTORY_MAX_TOKENS (respostas longas descartam os turnos mais antigos).
+    
+    Args:
+        memoria: Memória da conversa
+        
+    Returns:
+        list: Mensagens para o placeholder chat_history
+    """
+    mensagens = memoria.chat_memory.messages[-2 * config.MEMORY_WINDOW_TURNS:]
+    
+    resumo = getattr(memoria, 'moving_summary_buffer', '')
+    if resumo:
+        mensagens = [SystemMessage(content=resumo)] + mensagens
+    
+    return trim_messages(
+        mensagens,
+        max_tokens=config.HISTORY_MAX_TOKENS,
+        token_counter=conta_tokens_mensagens,
+        strategy="last",
+        start_on="human",
+        include_system=True
+    )
+
 
 def inicializar_sessao():
     """Inicializa as variáveis de sessão necessárias."""
+    # A memória só é criada quando ainda não existe (não a cada rerun) e
+    # nunca substitui a de uma conversa em andamento
+    if "memoria" not in st.session_state:
+        st.session_state["memoria"] = criar_memoria()
+    
     defaults = {
-        "memoria": ConversationBufferMemory(),
+        "historico_chat": [],
         "doc_memory_manager": None,
         "chain": None,
         "documento_carregado": False,
@@ -79,6 +180,103 @@ def inicializar_sessao():
             st.session_state[key] = value
 
 
+# Nome da função de carregamento (no módulo loaders) por tipo de arquivo
+FILE_LOADERS = {
+    'Pdf': 'carrega_pdf',
+    'Docx': 'carrega_docx',
+    'Csv': 'carrega_csv',
+    'Txt': 'carrega_txt',
+    'Site': 'carrega_site',
+    'Youtube': 'carrega_youtube'
+}
+
+def _get_loader(tipo_arquivo: str) -> Callable:
+    """
+    Retorna a função de carregamento para um tipo de arquivo.
+    
+    O módulo loaders (e as bibliotecas de PDF, Word e web que ele puxa) só
+    é importado no primeiro carregamento, e não na abertura da página.
+    
+    Args:
+        tipo_arquivo: Tipo do arquivo
+        
+    Returns:
+        Função carrega_* correspondente
+    """
+    import loaders
+    return getattr(loaders, FILE_LOADERS[tipo_arquivo])
+
+
+def _get_chat_class(provedor: str) -> type:
+    """
+    Retorna a classe de chat de um provedor.
+    
+    Os SDKs (langchain_groq, langchain_openai e suas dependências) só são
+    importados ao inicializar um modelo, e não na abertura da página.
+    
+    Args:
+        provedor: Provedor (Groq, OpenAI)
+        
+    Returns:
+        Classe de chat do LangChain
+    """
+    modulo, classe = CHAT_MODELS[provedor].split(':')
+    return getattr(importlib.import_module(modulo), classe)
+
+
+def _levanta_se_falhou(documento: str, status_msg: str) -> tuple[str, str]:
+    """
+    Converte falhas de carregamento em exceção para que não fiquem em cache.
+    
+    Args:
+        documento: Conteúdo retornado pelo loader
+        status_msg: Mensagem de status do loader
+        
+    Returns:
+        tuple: (conteúdo, mensagem de status) quando o carregamento funcionou
+    """
+    if not documento:
+        raise ValueError(status_msg or "❌ Documento não pôde ser carregado")
+    return documento, status_msg
+
+
+@st.cache_data(max_entries=16, ttl=3600, show_spinner=False)
+def _carrega_arquivo_cache(tipo_arquivo: str, arquivo_hash: str, _arquivo) -> tuple[str, str]:
+    """
+    Carrega um arquivo enviado por upload.
+    O resultado fica em cache pelo hash do conteúdo, então reenviar o mesmo
+    arquivo ou clicar em "Inicializar" novamente não refaz o parsing.
+    
+    Args:
+        tipo_arquivo: Tipo do arquivo
+        arquivo_hash: Hash do conteúdo (chave do cache)
+        _arquivo: Arquivo enviado (não entra na chave do cache)
+        
+    Returns:
+        tuple: (conteúdo, mensagem de status)
+    """
+    # Todos os loaders de upload leem direto da memória, sem arquivo temporário
+    _arquivo.seek(0)
+    return _levanta_se_falhou(*_get_loader(tipo_arquivo)(_arquivo))
+
+
+@st.cache_data(max_entries=16, ttl=3600, show_spinner=False)
+def _carrega_url_cache(tipo_arquivo: str, url: str) -> tuple[str, str]:
+    """
+    Carrega um Site ou vídeo do Youtube, com cache pela URL.
+    Cliques repetidos em "Inicializar" com a mesma URL dentro de uma hora
+    não refazem a requisição HTTP nem o parsing do HTML.
+    
+    Args:
+        tipo_arquivo: 'Site' ou 'Youtube'
+        url: URL a ser carregada
+        
+    Returns:
+        tuple: (conteúdo, mensagem de status)
+    """
+    return _levanta_se_falhou(*_get_loader(tipo_arquivo)(url))
+
+
 def carrega_arquivos(tipo_arquivo: str, arquivo) -> tuple[str, str]:
     """
     Função unificada para carregar arquivos com tratamento de erros.
@@ -94,36 +292,208 @@ def carrega_arquivos(tipo_arquivo: str, arquivo) -> tuple[str, str]:
         return "", "❌ Nenhum arquivo ou URL fornecido."
     
     try:
-        if tipo_arquivo == "Site":
-            return carrega_site(arquivo)
+        if tipo_arquivo in ("Site", "Youtube"):
+            return _carrega_url_cache(tipo_arquivo, arquivo)
+        
+        # Rejeitar arquivos grandes antes de qualquer hash, cópia ou parsing
+        tamanho = getattr(arquivo, 'size', 0)
+        if tamanho > config.MAX_FILE_SIZE_BYTES:
+            error_msg = f"❌ Arquivo muito grande ({tamanho / 1024 / 1024:.1f} MB). Limite: {config.MAX_FILE_SIZE_MB} MB"
+            logger.error(error_msg)
+            return "", error_msg
+        
+        arquivo_hash = calculate_stream_hash(arquivo, config.IO_BUFFER_SIZE)
+        return _carrega_arquivo_cache(tipo_arquivo, arquivo_hash, _arquivo=arquivo)
+    
+    except ValueError as e:
+        return "", str(e)
+    except Exception as e:
+        logger.error(f"Erro ao carregar arquivo: {e}")
+        return "", f"❌ Erro ao carregar arquivo: {str(e)}"
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _cria_chat(provedor: str, modelo: str, temperatura: float, api_key_hash: str, _api_key: str):
+    """
+    Cria o cliente de chat do provedor, reaproveitado entre reruns e sessões.
+    
+    A API key entra na chave do cache apenas pelo seu hash; o valor em si
+    é passado em um argumento com prefixo "_", que o Streamlit não hasheia.
+    
+    Args:
+        provedor: Provedor (Groq, OpenAI)
+        modelo: Nome do modelo
+        temperatura: Temperatura de geração
+        api_key_hash: Hash da API key (chave do cache)
+        _api_key: API key
         
-        elif tipo_arquivo == "Youtube":
-            return carrega_youtube(arquivo)
+    Returns:
+        Cliente de chat do LangChain
+    """
+    return _get_chat_class(provedor)(
+        model=modelo,
+        api_key=_api_key,
+        temperature=temperatura,
+        # Contagem de tokens local (usada pela memória ao resumir o histórico)
+        custom_get_token_ids=get_token_ids
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def _get_prompt_template(documento_grande: bool) -> ChatPromptTemplate:
+    """
+    Compila uma única vez o template do chat.
+    
+    Args:
+        documento_grande: Se usa o prompt de documentos grandes
         
-        # Para outros tipos, criar arquivo temporário
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{tipo_arquivo.lower()}") as temp:
-            temp.write(arquivo.read())
-            temp_path = temp.name
+    Returns:
+        ChatPromptTemplate: Template com as variáveis do contexto em aberto
+    """
+    if documento_grande:
+        regras, contexto = SYSTEM_PROMPT_DOCUMENTO_GRANDE, CONTEXTO_DOCUMENTO_GRANDE
+    else:
+        regras, contexto = SYSTEM_PROMPT_DOCUMENTO_PEQUENO, CONTEXTO_DOCUMENTO_PEQUENO
+    
+    # Do mais estável para o mais variável: regras, documento, histórico e,
+    # por último, os trechos recuperados para a pergunta atual
+    return ChatPromptTemplate.from_messages([
+        ('system', regras),
+        ('system', contexto),
+        ('placeholder', '{chat_history}'),
+        ('user', '{contexto_recuperado}{input}')
+    ])
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _cria_chain(
+    provedor: str,
+    modelo: str,
+    documento_grande: bool,
+    api_key_hash: str,
+    contexto_hash: str,
+    _api_key: str,
+    _contexto: dict
+):
+    """
+    Monta a chain (prompt + modelo) para um documento, com cache pelo hash
+    do contexto.
+    
+    O template pré-compilado recebe o contexto via partial. O texto do
+    documento pequeno ({documento}) chega na entrada de cada chamada, em vez
+    de ficar copiado dentro da chain.
+    
+    Args:
+        provedor: Provedor (Groq, OpenAI)
+        modelo: Nome do modelo
+        documento_grande: Se usa o prompt de documentos grandes
+        api_key_hash: Hash da API key (chave do cache)
+        contexto_hash: Hash do contexto do documento (chave do cache)
+        _api_key: API key
+        _contexto: Variáveis da mensagem de sistema (tipo, info, preview)
         
+    Returns:
+        Chain do LangChain pronta para stream
+    """
+    template = _get_prompt_template(documento_grande).partial(**_contexto)
+    
+    temperatura = model_config.PROVIDERS[provedor].get('temperatura_padrao', 0.7)
+    chat = _cria_chat(provedor, modelo, temperatura, api_key_hash, _api_key=_api_key)
+    
+    return template | chat
+
+
+@st.cache_resource(show_spinner=False)
+def _get_executor() -> ThreadPoolExecutor:
+    """Executor compartilhado entre as sessões para tarefas de carregamento."""
+    return ThreadPoolExecutor(
+        max_workers=config.LOADER_WORKERS,
+        thread_name_prefix="analyse_doc_loader"
+    )
+
+
+def executa_em_segundo_plano(func: Callable, *args) -> Future:
+    """
+    Executa uma função no executor compartilhado, propagando o contexto
+    do Streamlit para que caches e session_state continuem funcionando.
+    
+    Args:
+        func: Função a executar
+        *args: Argumentos da função
+        
+    Returns:
+        Future: Resultado futuro da execução
+    """
+    ctx = get_script_run_ctx()
+    
+    def _tarefa():
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, ctx)
         try:
-            if tipo_arquivo == "Pdf":
-                return carrega_pdf(temp_path)
-            elif tipo_arquivo == "Docx":
-                return carrega_docx(temp_path)
-            elif tipo_arquivo == "Csv":
-                return carrega_csv(temp_path)
-            elif tipo_arquivo == "Txt":
-                return carrega_txt(temp_path)
+            return func(*args)
         finally:
-            # Sempre remover arquivo temporário
-            try:
-                os.unlink(temp_path)
-            except Exception as e:
-                logger.error(f"Erro ao limpar arquivo temporário: {e}")
+            # A thread é reaproveitada pelo pool: soltar o contexto para não
+            # manter vivo o estado de uma sessão que já terminou
+            # (add_script_run_ctx(thread, None) reanexaria o contexto atual)
+            setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
     
-    except Exception as e:
-        logger.error(f"Erro ao carregar arquivo: {e}")
-        return "", f"❌ Erro ao carregar arquivo: {str(e)}"
+    return _get_executor().submit(_tarefa)
+
+
+def aguarda_resultado(future: Future, status_text, mensagem: str):
+    """
+    Aguarda um Future atualizando o texto de status com o tempo decorrido.
+    
+    Args:
+        future: Execução em andamento
+        status_text: Placeholder de texto do Streamlit
+        mensagem: Mensagem exibida enquanto aguarda
+        
+    Returns:
+        Resultado da função executada
+    """
+    inicio = time.monotonic()
+    while True:
+        try:
+            return future.result(timeout=config.LOADER_POLL_INTERVAL)
+        except FutureTimeoutError:
+            status_text.text(f"{mensagem} ({time.monotonic() - inicio:.0f}s)")
+
+
+def junta_documentos(arquivos: list, resultados: list) -> tuple[str, str]:
+    """
+    Junta o conteúdo de vários arquivos carregados em um único documento.
+    
+    Args:
+        arquivos: Arquivos enviados (ou a URL), na ordem do upload
+        resultados: (conteúdo, mensagem de status) de cada arquivo
+        
+    Returns:
+        tuple: (conteúdo, mensagem de status)
+    """
+    if len(resultados) == 1:
+        return resultados[0]
+    
+    partes = []
+    erros = []
+    for arquivo, (conteudo, status_msg) in zip(arquivos, resultados):
+        nome = getattr(arquivo, 'name', str(arquivo))
+        if conteudo:
+            # As páginas se repetem entre arquivos: o marcador leva o nome
+            # do arquivo para que a busca por página não fique ambígua
+            conteudo = _MARCADOR_PAGINA_RE.sub(
+                lambda m: f"--- {nome}, Página {m.group(1)} ---", conteudo
+            )
+            partes.append(f"=== Arquivo: {nome} ===\n{conteudo}")
+        else:
+            erros.append(f"{nome}: {status_msg}")
+    
+    if not partes:
+        return "", "❌ Nenhum arquivo pôde ser carregado. " + " | ".join(erros)
+    
+    for erro in erros:
+        logger.warning(f"Arquivo ignorado - {erro}")
+    return "\n\n".join(partes), f"✅ {len(partes)} de {len(resultados)} arquivos carregados"
 
 
 def carrega_modelo(provedor: str, modelo: str, api_key: str, tipo_arquivo: str, arquivo):
@@ -154,17 +524,39 @@ def carrega_modelo(provedor: str, modelo: str, api_key: str, tipo_arquivo: str,
         status_text.text("📄 Carregando documento...")
         progress_bar.progress(20)
         
-        documento, status_msg = carrega_arquivos(tipo_arquivo, arquivo)
+        # Vários uploads (ou URLs separadas por espaço) são carregados em
+        # paralelo no executor compartilhado, sobrepondo E/S de disco e rede
+        if isinstance(arquivo, list):
+            arquivos = arquivo
+        elif isinstance(arquivo, str):
+            arquivos = arquivo.split()
+        else:
+            arquivos = [arquivo]
+        futures = [
+            executa_em_segundo_plano(carrega_arquivos, tipo_arquivo, item)
+            for item in arquivos or [None]
+        ]
+        resultados = [
+            aguarda_resultado(future, status_text, "📄 Carregando documento...")
+            for future in futures
+        ]
+        documento, status_msg = junta_documentos(arquivos, resultados)
         
-        if not documento or documento.startswith("❌"):
-            st.error(status_msg if status_msg else "Documento não pôde ser carregado")
+        # Falhas sempre chegam como conteúdo vazio + mensagem de status
+        if not documento:
+            st.error(status_msg or "Documento não pôde ser carregado")
             progress_bar.empty()
             status_text.empty()
             return
         
-        # Armazenar documento completo
-        st.session_state['documento_completo'] = documento
-        st.session_state['tamanho_documento'] = len(documento)
+        # Decidir uma única vez entre documento pequeno (completo no prompt)
+        # e grande (preview + recuperação de trechos)
+        tamanho = len(documento)
+        documento_grande = tamanho > config.SMALL_DOCUMENT_THRESHOLD
+        st.session_state['usando_documento_grande'] = documento_grande
+        
+        # O texto fica apenas no doc_memory_manager; a sessão guarda só o tamanho
+        st.session_state['tamanho_documento'] = tamanho
         st.session_state['tipo_arquivo'] = tipo_arquivo
         
         # Inicializar gerenciador de memória
@@ -217,82 +609,61 @@ def carrega_modelo(provedor: str, modelo: str, api_key: str, tipo_arquivo: str,
         # Obter mapa do documento se disponível
         mapa_documento = st.session_state.get('mapa_documento', '')
         
-        if len(documento) > config.SMALL_DOCUMENT_THRESHOLD:
-            st.session_state['usando_documento_grande'] = True
+        if documento_grande:
             # Para documentos grandes, usar estratégia de recuperação
-            documento_preview = doc_manager.get_document_preview(max_chars=2000)
-            
-            system_message = f"""Você é um assistente especializado em análise de documentos.
-
-Você tem acesso a um documento {tipo_arquivo} com as seguintes informações:
-
-{mapa_documento if mapa_documento else f"- Total de páginas: {processamento['num_paginas']}\n- Tamanho: {len(documento)} caracteres\n- Processado em {processamento['total_chunks']} chunks"}
-
-PREVIEW DO DOCUMENTO:
-{documento_preview}
-
-IMPORTANTE: Este é apenas um preview. Para cada pergunta do usuário, você receberá:
-1. A estrutura completa do documento (capítulos, seções)
-2. Os trechos mais relevantes do documento completo
-3. Informações contextuais adicionais quando necessário
-
-INSTRUÇÕES CRÍTICAS:
-1. Use SEMPRE as informações dos trechos fornecidos para responder
-2. Quando perguntarem sobre capítulos específicos, use o conteúdo COMPLETO fornecido
-3. Se a informação não estiver nos trechos, diga "Não encontrei essa informação específica nos trechos analisados"
-4. Cite números de página quando disponíveis
-5. Seja preciso, detalhado e completo nas respostas
-6. Para perguntas sobre estrutura (quantos capítulos, lista de capítulos), use o MAPA DO DOCUMENTO fornecido
-7. Mantenha o contexto das perguntas anteriores quando relevante
-8. Nunca invente informações - use apenas o que foi fornecido"""
+            contexto = {
+                'tipo_arquivo': tipo_arquivo,
+                'info_documento': mapa_documento or (
+                    f"- Total de páginas: {processamento['num_paginas']}\n"
+                    f"- Tamanho: {tamanho} caracteres\n"
+                    f"- Processado em {processamento['total_chunks']} chunks"
+                ),
+                'documento_preview': doc_manager.get_document_preview(max_chars=2000),
+            }
         else:
-            st.session_state['usando_documento_grande'] = False
-            # Para documentos menores, incluir documento completo
-            system_message = f"""Você é um assistente especializado em análise de documentos.
-
-Você tem acesso completo ao seguinte documento {tipo_arquivo}:
-
-====== DOCUMENTO COMPLETO ======
-{documento}
-====== FIM DO DOCUMENTO ======
-
-{mapa_documento if mapa_documento else f"Total de páginas: {processamento['num_paginas']}\nTamanho: {len(documento)} caracteres"}
-
-INSTRUÇÕES:
-1. Use as informações do documento para responder às perguntas
-2. Seja preciso, detalhado e completo
-3. Cite números de página quando disponíveis
-4. Se não encontrar a informação, seja honesto sobre isso
-5. Mantenha o contexto das perguntas anteriores quando relevante
-6. Nunca invente informações - use apenas o conteúdo do documento"""
-        
-        # Criar template do prompt
-        template = ChatPromptTemplate.from_messages([
-            ('system', system_message),
-            ('placeholder', '{chat_history}'),
-            ('user', '{input}')
-        ])
-        
-        # Configurar modelo
-        temperatura = model_config.PROVIDERS[provedor].get('temperatura_padrao', 0.7)
-        
-        if provedor == 'Groq':
-            chat = ChatGroq(
-                model=modelo,
-                api_key=api_key,
-                temperature=temperatura
-            )
-        else:  # OpenAI
-            chat = ChatOpenAI(
-                model=modelo,
-                api_key=api_key,
-                temperature=temperatura
-            )
+            # Para documentos menores, o documento completo entra via {documento}
+            contexto = {
+                'tipo_arquivo': tipo_arquivo,
+                'info_documento': mapa_documento or (
+                    f"Total de páginas: {processamento['num_paginas']}\n"
+                    f"Tamanho: {tamanho} caracteres"
+                ),
+            }
+        
+        # Criar chain (template + modelo), reaproveitada entre reruns
+        provider_config = model_config.PROVIDERS[provedor]
+        api_key_hash = calculate_file_hash(api_key)
+        chain = _cria_chain(
+            provedor,
+            modelo,
+            documento_grande,
+            api_key_hash,
+            calculate_file_hash(repr(sorted(contexto.items()))),
+            _api_key=api_key,
+            _contexto=contexto
+        )
         
-        chain = template | chat
+        # Modelo leve para resumir o histórico da conversa
+        summary_llm = _cria_chat(
+            provedor,
+            provider_config.get('modelo_resumo', modelo),
+            0,
+            api_key_hash,
+            _api_key=api_key
+        )
+        memoria = criar_memoria(summary_llm)
+        memoria_anterior = st.session_state.get('memoria')
+        if memoria_anterior is not None:
+            memoria.chat_memory.messages = list(memoria_anterior.chat_memory.messages)
+            # Turnos antigos já resumidos só existem no resumo acumulado
+            resumo_anterior = getattr(memoria_anterior, 'moving_summary_buffer', '')
+            if resumo_anterior:
+                memoria.moving_summary_buffer = resumo_anterior
         
         # Salvar na sessão
         st.session_state['chain'] = chain
+        st.session_state['summary_llm'] = summary_llm
+        st.session_state['memoria'] = memoria
         st.session_state['documento_carregado'] = True
         st.session_state['provedor_atual'] = provedor
         st.session_state['modelo_atual'] = modelo
@@ -306,14 +677,13 @@ INSTRUÇÕES:
         
         info_html = format_document_info({
             'tipo': tipo_arquivo,
-            'tamanho': len(documento),
+            'tamanho': tamanho,
             'num_paginas': processamento['num_paginas'],
             'num_chunks': processamento['total_chunks']
         })
         st.sidebar.markdown(info_html, unsafe_allow_html=True)
         
         # Limpar progress
-        import time
         time.sleep(1)
         progress_bar.empty()
         status_text.empty()
@@ -323,36 +693,62 @@ INSTRUÇÕES:
         st.error(f"❌ Erro ao processar documento: {str(e)}")
 
 
+def formata_trecho(numero: int, chunk) -> str:
+    """
+    Formata um chunk recuperado para o contexto da pergunta.
+    
+    Args:
+        numero: Posição do trecho (a partir de 1)
+        chunk: Documento do LangChain
+        
+    Returns:
+        str: Cabeçalho do trecho seguido do conteúdo
+    """
+    chunk_id = chunk.metadata.get('chunk_id')
+    if chunk_id is None:
+        return f"[Trecho {numero}]\n{chunk.page_content}"
+    return f"[Trecho {numero} - Chunk #{chunk_id}]\n{chunk.page_content}"
+
+
 def processar_pergunta_com_documento(
     input_usuario: str, 
     chain, 
-    memoria: ConversationBufferMemory
+    memoria: ConversationSummaryBufferMemory
 ) -> Generator[str, None, None]:
     """
     Processa perguntas usando chunks relevantes do documento de forma otimizada.
     VERSÃO MELHORADA com SmartRetriever.
+    
+    Gera apenas os trechos novos da resposta (deltas); cabe a quem consome
+    acumulá-los.
     """
     try:
-        memory_manager = st.session_state.get('doc_memory_manager')
+        # Uma única referência à sessão para todo o processamento da pergunta
+        sessao = st.session_state
+        memory_manager = sessao.get('doc_memory_manager')
         if not memory_manager:
             yield "❌ Erro: Sistema não conseguiu acessar o documento. Por favor, tente recarregar."
             return
         
         # Obter configurações
-        k_chunks = st.session_state.get('k_chunks', config.DEFAULT_K_CHUNKS)
-        usando_doc_grande = st.session_state.get('usando_documento_grande', False)
+        k_chunks = sessao.get('k_chunks', config.DEFAULT_K_CHUNKS)
+        usando_doc_grande = sessao.get('usando_documento_grande', False)
         
         # Usar SmartRetriever se disponível
-        smart_retriever = st.session_state.get('smart_retriever')
+        smart_retriever = sessao.get('smart_retriever')
         
         if not usando_doc_grande:
             # Documento pequeno - usar completo (já está no contexto do sistema)
-            pergunta_completa = input_usuario
+            contexto_recuperado = ""
         else:
             # Documento grande - usar recuperação inteligente
-            if smart_retriever and 'doc_chunks' in st.session_state:
+            if memory_manager.is_page_count_question(input_usuario):
+                # Respondida pelos metadados, sem análise estrutural nem busca
+                chunks_relevantes = memory_manager.retrieve_relevant_chunks(input_usuario)
+                contexto_estrutural = ""
+            elif smart_retriever and sessao.get('doc_chunks'):
                 # === USAR SMART RETRIEVER ===
-                chunks = st.session_state['doc_chunks']
+                chunks = sessao['doc_chunks']
                 
                 try:
                     chunks_relevantes, contexto_estrutural = smart_retriever.retrieve_with_structure(
@@ -376,45 +772,24 @@ def processar_pergunta_com_documento(
                 yield "⚠️ Não consegui encontrar informações relevantes no documento para responder sua pergunta. Tente reformular a pergunta ou seja mais específico."
                 return
             
-            # Montar contexto com os chunks
-            contexto_chunks = []
-            for i, chunk in enumerate(chunks_relevantes):
-                chunk_info = f"[Trecho {i+1}"
-                if 'chunk_id' in chunk.metadata:
-                    chunk_info += f" - Chunk #{chunk.metadata['chunk_id']}"
-                chunk_info += "]\n" + chunk.page_content
-                contexto_chunks.append(chunk_info)
-            
-            contexto_relevante = "\n\n---\n\n".join(contexto_chunks)
+            # Montar contexto com os chunks, em uma única concatenação
+            contexto_relevante = "\n\n---\n\n".join(
+                formata_trecho(i, chunk) for i, chunk in enumerate(chunks_relevantes, 1)
+            )
             
             # Montar prompt final com todo o contexto
             if contexto_estrutural:
-                prompt_adicional = f"""{contexto_estrutural}
-
-TRECHOS RELEVANTES DO DOCUMENTO PARA ESTA PERGUNTA:
-{contexto_relevante}
-
-
-IMPORTANTE: 
-- Use TODAS as informações acima (estrutura E trechos) para responder
-- Se houver informações sobre capítulos específicos, use o conteúdo COMPLETO fornecido
-- Seja detalhado e preciso
-- Cite informações específicas dos trechos
-- Se a resposta estiver clara nos trechos, forneça uma resposta completa"""
+                contexto_recuperado = PROMPT_TRECHOS_COM_ESTRUTURA.format(
+                    estrutura=contexto_estrutural,
+                    trechos=contexto_relevante
+                )
             else:
-                prompt_adicional = f"""TRECHOS RELEVANTES DO DOCUMENTO PARA ESTA PERGUNTA:
-{contexto_relevante}
-
-
-IMPORTANTE:
-- Use as informações acima para responder
-- Seja preciso e detalhado
-- Cite informações específicas quando possível"""
-            
-            pergunta_completa = f"{prompt_adicional}\n\nPERGUNTA DO USUÁRIO: {input_usuario}"
+                contexto_recuperado = PROMPT_TRECHOS.format(trechos=contexto_relevante)
+        
+        pergunta_completa = contexto_recuperado + input_usuario
         
         # Debug info
-        if st.session_state.get('show_debug', False):
+        if sessao.get('show_debug', False):
             with st.expander("🔍 Debug - Informações de Processamento"):
                 st.text(f"SmartRetriever ativo: {smart_retriever is not None}")
                 st.text(f"Documento grande: {usando_doc_grande}")
@@ -431,31 +806,41 @@ IMPORTANTE:
                 st.code(pergunta_completa[:2000] + "..." if len(pergunta_completa) > 2000 else pergunta_completa)
         
         # Gerar resposta com streaming
-        resposta_completa = ""
-        for chunk in chain.stream({
-            "input": pergunta_completa,
-            "chat_history": memoria.buffer_as_messages
-        }):
-            if hasattr(chunk, 'content'):
-                resposta_completa += chunk.content
-            else:
-                resposta_completa += str(chunk)
-            yield resposta_completa
+        partes_resposta = []
+        get_content = attrgetter('content')
+        entrada = {
+            "contexto_recuperado": contexto_recuperado,
+            "input": input_usuario,
+            "chat_history": janela_historico(memoria)
+        }
+        if not usando_doc_grande:
+            entrada["documento"] = memory_manager.get_full_document()
+        
+        for chunk in chain.stream(entrada):
+            # Os chunks do LangChain sempre têm .content; str() é só um fallback
+            try:
+                parte = get_content(chunk)
+            except AttributeError:
+                parte = str(chunk)
+            partes_resposta.append(parte)
+            yield parte
+        
+        resposta_completa = "".join(partes_resposta)
         
         # Atualizar estatísticas
-        st.session_state['total_queries'] = st.session_state.get('total_queries', 0) + 1
+        sessao['total_queries'] = sessao.get('total_queries', 0) + 1
         
         # Estimar tokens e custo
         input_tokens = estimate_tokens(pergunta_completa)
         output_tokens = estimate_tokens(resposta_completa)
         total_tokens = input_tokens + output_tokens
         
-        st.session_state['tokens_used'] = st.session_state.get('tokens_used', 0) + total_tokens
+        sessao['tokens_used'] = sessao.get('tokens_used', 0) + total_tokens
         
-        provedor = st.session_state.get('provedor_atual', 'Groq')
-        modelo = st.session_state.get('modelo_atual', '')
+        provedor = sessao.get('provedor_atual', 'Groq')
+        modelo = sessao.get('modelo_atual', '')
         cost = estimate_cost(total_tokens, provedor, modelo)
-        st.session_state['cost_accumulated'] = st.session_state.get('cost_accumulated', 0.0) + cost['total_estimated']
+        sessao['cost_accumulated'] = sessao.get('cost_accumulated', 0.0) + cost['total_estimated']
         
         # Log para análise
         logger.info(f"Pergunta processada - Tokens: {total_tokens}, Custo estimado: ${cost['total_estimated']:.4f}")
@@ -465,6 +850,39 @@ IMPORTANTE:
         yield f"❌ Erro ao processar sua pergunta: {str(e)}\n\nTente reformular ou recarregar o documento."
 
 
+def agrupa_stream(partes: Iterable[str]) -> Generator[str, None, None]:
+    """
+    Agrupa as partes do streaming em lotes para reduzir as atualizações da tela.
+    
+    Um lote é liberado quando passa STREAM_FLUSH_INTERVAL desde o último ou
+    quando acumula STREAM_FLUSH_CHARS caracteres; o restante sai no final.
+    
+    Args:
+        partes: Trechos da resposta, na ordem em que chegam
+        
+    Yields:
+        str: Lotes de texto
+    """
+    lote = []
+    tamanho_lote = 0
+    ultimo_flush = time.monotonic()
+    
+    for parte in partes:
+        lote.append(parte)
+        tamanho_lote += len(parte)
+        
+        agora = time.monotonic()
+        if (agora - ultimo_flush >= config.STREAM_FLUSH_INTERVAL
+                or tamanho_lote >= config.STREAM_FLUSH_CHARS):
+            yield "".join(lote)
+            lote = []
+            tamanho_lote = 0
+            ultimo_flush = agora
+    
+    if lote:
+        yield "".join(lote)
+
+
 def pagina_chat():
     """Interface principal do chat."""
     st.markdown('<h1 class="main-header">📑 Analyse Doc</h1>', unsafe_allow_html=True)
@@ -531,25 +949,30 @@ def pagina_chat():
         
         st.stop()
     
-    # Chat ativo
-    memoria = st.session_state.get('memoria', ConversationBufferMemory())
+    chat_ativo()
+
+
+@st.fragment
+def chat_ativo():
+    """
+    Histórico, entrada e resposta do chat.
+    
+    Como fragmento, enviar uma pergunta reexecuta só esta função enquanto a
+    resposta é gerada; terminada a resposta, a página é reexecutada uma vez
+    para atualizar as estatísticas da sidebar.
+    """
+    chain = st.session_state['chain']
+    memoria = st.session_state.get('memoria') or criar_memoria()
+    historico = st.session_state.setdefault('historico_chat', [])
     
     # Container para mensagens
     chat_container = st.container()
     
     with chat_container:
-        # Exibir histórico
-        for mensagem in memoria.buffer_as_messages:
-            if mensagem.type == 'ai':
-                st.markdown(
-                    f'<div class="chat-message-ai">🤖 {mensagem.content}</div>', 
-                    unsafe_allow_html=True
-                )
-            else:
-                st.markdown(
-                    f'<div class="chat-message-human">👤 {mensagem.content}</div>', 
-                    unsafe_allow_html=True
-                )
+        # Exibir histórico (completo, mesmo que a memória já tenha resumido parte dele)
+        for mensagem in historico:
+            with st.chat_message(mensagem.type):
+                st.markdown(mensagem.content)
     
     # Input do usuário
     input_usuario = st.chat_input("Faça perguntas sobre o documento carregado...")
@@ -557,36 +980,35 @@ def pagina_chat():
     if input_usuario:
         # Exibir pergunta do usuário
         with chat_container:
-            st.markdown(
-                f'<div class="chat-message-human">👤 {input_usuario}</div>', 
-                unsafe_allow_html=True
-            )
+            with st.chat_message('human'):
+                st.markdown(input_usuario)
         
         try:
             with st.spinner("🤔 Analisando documento e preparando resposta..."):
                 with chat_container:
-                    resposta_container = st.empty()
-                    
-                    # Processar com streaming
-                    for resposta_parcial in processar_pergunta_com_documento(
-                        input_usuario, chain, memoria
-                    ):
-                        resposta_container.markdown(
-                            f'<div class="chat-message-ai">🤖 {resposta_parcial}</div>',
-                            unsafe_allow_html=True
+                    with st.chat_message('ai'):
+                        # write_stream acrescenta os lotes à mensagem e devolve o texto completo
+                        resposta_completa = st.write_stream(
+                            agrupa_stream(
+                                processar_pergunta_com_documento(input_usuario, chain, memoria)
+                            )
                         )
-                    
-                    resposta_completa = resposta_parcial
             
-            # Adicionar à memória
-            memoria.chat_memory.add_user_message(input_usuario)
-            memoria.chat_memory.add_ai_message(resposta_completa)
+            # Adicionar à memória (save_context resume o histórico se necessário)
+            memoria.save_context({"input": input_usuario}, {"output": resposta_completa})
             st.session_state['memoria'] = memoria
+            historico.append(HumanMessage(content=input_usuario))
+            historico.append(AIMessage(content=resposta_completa))
             
         except Exception as e:
             with chat_container:
                 st.error(f"❌ Erro ao processar resposta: {str(e)}")
             logger.error(f"Erro no chat: {e}", exc_info=True)
+            return
+        
+        # A aba 📊 Stats é desenhada pela sidebar, fora do fragmento: uma
+        # reexecução completa, só depois da resposta, atualiza os contadores
+        st.rerun(scope="app")
 
 
 def sidebar():
@@ -610,35 +1032,39 @@ def sidebar():
             arquivo = st.text_input(
                 'URL do site',
                 placeholder="https://exemplo.com",
-                help="Cole a URL completa do site que deseja analisar"
+                help="Cole a URL completa do site que deseja analisar (várias URLs separadas por espaço)"
             )
         elif tipo_arquivo == 'Youtube':
             arquivo = st.text_input(
                 'URL do vídeo',
                 placeholder="https://www.youtube.com/watch?v=...",
-                help="Cole a URL do vídeo do YouTube"
+                help="Cole a URL do vídeo do YouTube (várias URLs separadas por espaço)"
             )
         elif tipo_arquivo == 'Pdf':
             arquivo = st.file_uploader(
                 'Upload do PDF',
+                accept_multiple_files=True,
                 type=['pdf'],
                 help=f"Tamanho máximo: {config.MAX_FILE_SIZE_MB} MB"
             )
         elif tipo_arquivo == 'Docx':
             arquivo = st.file_uploader(
                 'Upload do Word',
+                accept_multiple_files=True,
                 type=['docx'],
                 help=f"Tamanho máximo: {config.MAX_FILE_SIZE_MB} MB"
             )
         elif tipo_arquivo == 'Csv':
             arquivo = st.file_uploader(
                 'Upload do CSV',
+                accept_multiple_files=True,
                 type=['csv'],
                 help=f"Tamanho máximo: {config.MAX_FILE_SIZE_MB} MB"
             )
         elif tipo_arquivo == 'Txt':
             arquivo = st.file_uploader(
                 'Upload do TXT',
+                accept_multiple_files=True,
                 type=['txt'],
                 help=f"Tamanho máximo: {config.MAX_FILE_SIZE_MB} MB"
             )
@@ -649,13 +1075,13 @@ def sidebar():
         
         provedor = st.selectbox(
             'Provedor',
-            list(model_config.PROVIDERS.keys()),
+            PROVEDORES,
             help="Escolha o provedor de IA"
         )
         
         modelo = st.selectbox(
             'Modelo',
-            model_config.PROVIDERS[provedor]['modelos'],
+            MODELOS_POR_PROVEDOR[provedor],
             help="Selecione o modelo específico"
         )
         
@@ -680,7 +1106,7 @@ def sidebar():
         st.subheader("⚙️ Configurações Avançadas")
         
         # Mostrar info do documento se carregado
-        if 'doc_memory_manager' in st.session_state and 'documento_completo' in st.session_state:
+        if 'doc_memory_manager' in st.session_state and 'tamanho_documento' in st.session_state:
             memory_manager = st.session_state['doc_memory_manager']
             info = memory_manager.get_document_info()
             
@@ -772,7 +1198,8 @@ def sidebar():
     
     with col2:
         if st.button('🗑️ Limpar Chat', use_container_width=True):
-            st.session_state['memoria'] = ConversationBufferMemory()
+            st.session_state['memoria'] = criar_memoria(st.session_state.get('summary_llm'))
+            st.session_state['historico_chat'] = []
             st.sidebar.success("✅ Chat limpo!")
             st.rerun()
     
@@ -780,16 +1207,17 @@ def sidebar():
     if st.sidebar.button('📄 Novo Documento', use_container_width=True):
         # Limpar tudo relacionado ao documento
         keys_to_clear = [
-            'chain', 'documento_completo', 'doc_memory_manager',
-            'doc_chunks', 'vector_store', 'documento_carregado',
-            'memoria', 'tamanho_documento', 'tipo_arquivo',
+            'chain', 'doc_memory_manager',
+            'doc_chunks', 'embedding_matrix', 'documento_carregado',
+            'memoria', 'historico_chat', 'tamanho_documento', 'tipo_arquivo',
             'smart_retriever', 'estrutura_documento', 'mapa_documento'
         ]
         for key in keys_to_clear:
             if key in st.session_state:
                 del st.session_state[key]
         
-        st.session_state['memoria'] = ConversationBufferMemory()
+        st.session_state['memoria'] = criar_memoria(st.session_state.get('summary_llm'))
+        st.session_state['historico_chat'] = []
         st.sidebar.success("✅ Pronto para novo documento!")
         st.rerun()
     
@@ -816,6 +1244,9 @@ def sidebar():
 def main():
     """Função principal da aplicação."""
     try:
+        # Aplicar estilos personalizados
+        aplicar_estilos()
+        
         # Inicializar sessão
         inicializar_sessao()
         
@@ -2,6 +2,7 @@
 Configurações centralizadas do projeto Analyse Doc.
 """
 import os
+from types import MappingProxyType
 from typing import Dict, List
 from dataclasses import dataclass
 
@@ -16,6 +17,7 @@ class AppConfig:
     MAX_FILE_SIZE_MB = 50
     MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
     SMALL_DOCUMENT_THRESHOLD = 25000  # caracteres
+    IO_BUFFER_SIZE = 1024 * 1024  # bytes por bloco ao copiar/hashear uploads
     
     # Configurações de chunking
     DEFAULT_CHUNK_SIZE = 2000
@@ -27,11 +29,31 @@ class AppConfig:
     DEFAULT_K_CHUNKS = 2
     MIN_K_CHUNKS = 1
     MAX_K_CHUNKS = 5
+    MAX_CHAPTER_TOKENS = 1250  # conteúdo de capítulo enviado ao modelo
+    
+    # Modelo de embeddings (multilíngue, suportado pelo fastembed e pelo sentence-transformers)
+    EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    EMBEDDING_BATCH_SIZE = 64  # chunks por lote na indexação
+    
+    # Memória da conversa (acima disso, mensagens antigas são resumidas)
+    MEMORY_MAX_TOKENS = 800
+    MEMORY_WINDOW_TURNS = 6  # turnos (pergunta + resposta) enviados ao modelo
+    HISTORY_MAX_TOKENS = 2000  # limite do histórico enviado ao modelo por pergunta
+    
+    # Streaming: intervalo mínimo (s) ou crescimento (caracteres) entre atualizações da tela
+    STREAM_FLUSH_INTERVAL = 0.05
+    STREAM_FLUSH_CHARS = 200
     
     # Cache
     ENABLE_CACHE = True
+    EMBED_QUERY_CACHE_SIZE = 1024  # embeddings de consultas memorizados
+    PROCESSING_CACHE_SIZE = 4  # documentos processados mantidos por sessão
     CACHE_DIR = ".cache"
     
+    # Threads para carregamento de documentos em segundo plano
+    LOADER_WORKERS = 4
+    LOADER_POLL_INTERVAL = 0.5  # segundos
+    
     # Configurações de retry
     MAX_RETRIES = 5
     RETRY_DELAY = 3
@@ -40,48 +62,59 @@ class AppConfig:
 @dataclass
 class ModelConfig:
     """Configurações de modelos de IA."""
-    PROVIDERS = {
-        'Groq': {
-            'modelos': [
+    # Somente leitura: evita mutação acidental durante os reruns do Streamlit
+    PROVIDERS = MappingProxyType({
+        'Groq': MappingProxyType({
+            'modelos': (
                 'llama-3.3-70b-versatile',
                 'llama-3.1-8b-instant',
                 'mixtral-8x7b-32768',
-                'gemma2-9b-it'
-            ],
+                'gemma2-9b-it',
+            ),
+            'modelo_resumo': 'llama-3.1-8b-instant',
             'temperatura_padrao': 0.7,
             'max_tokens': 4096
-        },
-        'OpenAI': {
-            'modelos': [
+        }),
+        'OpenAI': MappingProxyType({
+            'modelos': (
                 'gpt-4o-mini',
                 'gpt-4o',
                 'gpt-4-turbo',
-                'gpt-3.5-turbo'
-            ],
+                'gpt-3.5-turbo',
+            ),
+            'modelo_resumo': 'gpt-4o-mini',
             'temperatura_padrao': 0.7,
             'max_tokens': 4096
-        }
-    }
+        }),
+    })
+
+
+# Opções dos seletores, calculadas uma vez no import (o app.py é reexecutado a cada rerun)
+PROVEDORES = tuple(ModelConfig.PROVIDERS.keys())
+MODELOS_POR_PROVEDOR = MappingProxyType({
+    provedor: dados['modelos']
+    for provedor, dados in ModelConfig.PROVIDERS.items()
+})
 
 
 @dataclass
 class FileTypes:
     """Tipos de arquivos suportados."""
-    SUPPORTED_TYPES = ['Site', 'Youtube', 'Pdf', 'Docx', 'Csv', 'Txt']
+    SUPPORTED_TYPES = ('Site', 'Youtube', 'Pdf', 'Docx', 'Csv', 'Txt')
     
-    FILE_EXTENSIONS = {
-        'Pdf': ['.pdf'],
-        'Docx': ['.docx', '.doc'],
-        'Csv': ['.csv'],
-        'Txt': ['.txt']
-    }
+    FILE_EXTENSIONS = MappingProxyType({
+        'Pdf': ('.pdf',),
+        'Docx': ('.docx', '.doc'),
+        'Csv': ('.csv',),
+        'Txt': ('.txt',)
+    })
     
-    MIME_TYPES = {
+    MIME_TYPES = MappingProxyType({
         'Pdf': 'application/pdf',
         'Docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
         'Csv': 'text/csv',
         'Txt': 'text/plain'
-    }
+    })
 
 
 # Stopwords em português para recuperação de chunks
@@ -94,6 +127,82 @@ STOPWORDS_PT = {
     'the', 'is', 'are', 'was', 'were', 'in', 'on', 'at', 'to', 'for', 'of', 'and', 'or'
 }
 
+# Mensagens de sistema do chat. As regras são fixas (prefixo estável, que
+# aproveita o cache de prompt dos provedores); o contexto de cada documento
+# vem em uma segunda mensagem, com os trechos variáveis como variáveis do
+# template, então o texto do documento nunca é interpretado como template.
+SYSTEM_PROMPT_DOCUMENTO_GRANDE = """Você é um assistente especializado em análise de documentos.
+
+Na próxima mensagem você receberá as informações e um preview do documento.
+IMPORTANTE: É apenas um preview. Para cada pergunta do usuário, você receberá:
+1. A estrutura completa do documento (capítulos, seções)
+2. Os trechos mais relevantes do documento completo
+3. Informações contextuais adicionais quando necessário
+
+INSTRUÇÕES CRÍTICAS:
+1. Use SEMPRE as informações dos trechos fornecidos para responder
+2. Quando perguntarem sobre capítulos específicos, use o conteúdo COMPLETO fornecido
+3. Se a informação não estiver nos trechos, diga "Não encontrei essa informação específica nos trechos analisados"
+4. Cite números de página quando disponíveis
+5. Seja preciso, detalhado e completo nas respostas
+6. Para perguntas sobre estrutura (quantos capítulos, lista de capítulos), use o MAPA DO DOCUMENTO fornecido
+7. Mantenha o contexto das perguntas anteriores quando relevante
+8. Nunca invente informações - use apenas o que foi fornecido"""
+
+CONTEXTO_DOCUMENTO_GRANDE = """Você tem acesso a um documento {tipo_arquivo} com as seguintes informações:
+
+{info_documento}
+
+PREVIEW DO DOCUMENTO:
+{documento_preview}"""
+
+SYSTEM_PROMPT_DOCUMENTO_PEQUENO = """Você é um assistente especializado em análise de documentos.
+
+Na próxima mensagem você receberá o documento completo.
+
+INSTRUÇÕES:
+1. Use as informações do documento para responder às perguntas
+2. Seja preciso, detalhado e completo
+3. Cite números de página quando disponíveis
+4. Se não encontrar a informação, seja honesto sobre isso
+5. Mantenha o contexto das perguntas anteriores quando relevante
+6. Nunca invente informações - use apenas o conteúdo do documento"""
+
+CONTEXTO_DOCUMENTO_PEQUENO = """Você tem acesso completo ao seguinte documento {tipo_arquivo}:
+
+====== DOCUMENTO COMPLETO ======
+{documento}
+====== FIM DO DOCUMENTO ======
+
+{info_documento}"""
+
+# Contexto recuperado para cada pergunta (vai antes da pergunta do usuário)
+PROMPT_TRECHOS_COM_ESTRUTURA = """{estrutura}
+
+TRECHOS RELEVANTES DO DOCUMENTO PARA ESTA PERGUNTA:
+{trechos}
+
+
+IMPORTANTE: 
+- Use TODAS as informações acima (estrutura E trechos) para responder
+- Se houver informações sobre capítulos específicos, use o conteúdo COMPLETO fornecido
+- Seja detalhado e preciso
+- Cite informações específicas dos trechos
+- Se a resposta estiver clara nos trechos, forneça uma resposta completa
+
+PERGUNTA DO USUÁRIO: """
+
+PROMPT_TRECHOS = """TRECHOS RELEVANTES DO DOCUMENTO PARA ESTA PERGUNTA:
+{trechos}
+
+
+IMPORTANTE:
+- Use as informações acima para responder
+- Seja preciso e detalhado
+- Cite informações específicas quando possível
+
+PERGUNTA DO USUÁRIO: """
+
 # Estilos CSS customizados
 CUSTOM_CSS = """
 <style>
@@ -104,22 +213,6 @@ CUSTOM_CSS = """
         text-align: center;
         margin-bottom: 1rem;
     }
-    .chat-message-ai {
-        padding: 0.8rem 1rem;
-        margin-bottom: 0.5rem;
-        border-radius: 0.5rem;
-        background-color: rgba(100, 149, 237, 0.1);
-        border-left: 3px solid #4F8BF9;
-        animation: fadeIn 0.3s;
-    }
-    .chat-message-human {
-        padding: 0.8rem 1rem;
-        margin-bottom: 0.5rem;
-        border-radius: 0.5rem;
-        background-color: rgba(220, 220, 220, 0.2);
-        border-left: 3px solid #808080;
-        animation: fadeIn 0.3s;
-    }
     .stButton > button {
         background-color: #4F8BF9;
         color: white;
@@ -37,7 +37,7 @@ class DocumentDiagnostic:
             r'Chapter\s+(\d+)[\s:.-]+(.+?)(?=\n|$)',
             r'^\s*(\d+)\s*[-–—.]\s*(.+?)(?=\n|$)',
             r'^\s*(\d+)\.\s+(.+?)(?=\n|$)',
-            r'---\s*Página\s+(\d+)\s*---'
+            r'---\s*(?:.+?,\s*)?Página\s+(\d+)\s*---'
         ]
         
         linhas = documento.split('\n')
@@ -214,7 +214,7 @@ class DocumentDiagnostic:
 def adicionar_interface_diagnostico():
     """Adiciona interface de diagnóstico na sidebar."""
     
-    if 'documento_completo' not in st.session_state:
+    if st.session_state.get('doc_memory_manager') is None:
         return
     
     with st.sidebar.expander("🔍 Diagnóstico Avançado"):
@@ -222,7 +222,7 @@ def adicionar_interface_diagnostico():
         
         if st.button("Analisar Estrutura", use_container_width=True):
             with st.spinner("Analisando documento..."):
-                documento = st.session_state['documento_completo']
+                documento = st.session_state['doc_memory_manager'].get_full_document()
                 
                 diagnostico = DocumentDiagnostic()
                 estrutura = diagnostico.analizar_estrutura_documento(documento)
@@ -272,7 +272,7 @@ def adicionar_interface_diagnostico():
                 )
                 
                 if st.button("Extrair", use_container_width=True):
-                    documento = st.session_state['documento_completo']
+                    documento = st.session_state['doc_memory_manager'].get_full_document()
                     diagnostico = DocumentDiagnostic()
                     
                     conteudo = diagnostico.extrair_capitulo_especifico(
@@ -3,11 +3,12 @@ Módulo avançado para gerenciamento de memória e processamento de documentos.
 Implementa chunking, indexação vetorial opcional e recuperação inteligente.
 """
 import logging
+from functools import lru_cache
+import numpy as np
 import streamlit as st
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.embeddings import FastEmbedEmbeddings, HuggingFaceEmbeddings
 import os
 import tempfile
 import hashlib
@@ -19,6 +20,26 @@ from utils import calculate_file_hash, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+# Expressões regulares compiladas uma única vez (usadas a cada pergunta)
+_PERGUNTA_PAGINAS_RE = re.compile(
+    r'quantas\s+p[áa]ginas|n[úu]mero\s+de\s+p[áa]ginas', re.IGNORECASE
+)
+_PONTUACAO_RE = re.compile(r'[^\w\s]')
+# Padrões que indicam o número de páginas, em uma única alternância para
+# percorrer o documento uma vez só
+_PAGINAS_RE = re.compile(
+    "|".join((
+        r"Total de páginas:\s*(\d+)",
+        r"Páginas:\s*(\d+)",
+        r"(\d+)\s*páginas",
+        r"página\s*\d+\s*de\s*(\d+)",
+        r"--- (?:.+?, )?Página\s+(\d+)\s+---"
+    )),
+    re.IGNORECASE
+)
+# Cabeçalho de cada arquivo quando vários uploads são juntados (junta_documentos)
+_ARQUIVO_RE = re.compile(r"^=== Arquivo: .+ ===$", re.MULTILINE)
+
 
 class DocumentMemoryManager:
     """
@@ -36,8 +57,14 @@ class DocumentMemoryManager:
         self.use_embeddings = use_embeddings
         self.config = AppConfig()
         self.temp_dir = tempfile.mkdtemp()
-        self.vector_store = None
+        self.embedding_matrix = None
         self.embedding_model = None
+        # Texto completo do documento processado (o gerenciador fica na sessão)
+        self._documento = ""
+        # Cache por instância: consultas repetidas não são re-embeddadas
+        self._embed_query = lru_cache(maxsize=self.config.EMBED_QUERY_CACHE_SIZE)(
+            self._embed_query_uncached
+        )
         
         if self.use_embeddings:
             self._init_embeddings()
@@ -45,11 +72,9 @@ class DocumentMemoryManager:
     def _init_embeddings(self):
         """Inicializa o modelo de embeddings."""
         try:
-            # Usando modelo multilíngue otimizado
-            self.embedding_model = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-                model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True}
+            self.embedding_model = get_embedding_model(
+                self.config.EMBEDDING_MODEL,
+                self.config.EMBEDDING_BATCH_SIZE
             )
             logger.info("Modelo de embeddings inicializado com sucesso")
         except Exception as e:
@@ -83,6 +108,20 @@ class DocumentMemoryManager:
         # Calcular hash do documento
         doc_hash = calculate_file_hash(documento)
         
+        self._documento = documento
+        
+        # Reaproveitar o processamento se o mesmo documento já foi processado
+        # nesta sessão com os mesmos parâmetros (evita re-chunking e re-embedding)
+        cache = st.session_state.setdefault("_processamento_cache", {})
+        cache_key = (doc_hash, tipo_documento, chunk_size, chunk_overlap, self.use_embeddings)
+        st.session_state["_processamento_chave"] = cache_key
+        if cache_key in cache:
+            documents, embedding_matrix, resultado = cache[cache_key]
+            self.embedding_matrix = embedding_matrix
+            self._store_in_session(documents, resultado, embedding_matrix)
+            logger.info(f"Processamento recuperado do cache: {doc_hash}")
+            return dict(resultado)
+        
         # Contar páginas
         num_paginas = self._count_pages(documento, tipo_documento)
         
@@ -103,34 +142,19 @@ class DocumentMemoryManager:
             doc = Document(page_content=chunk, metadata=metadata)
             documents.append(doc)
         
-        # Armazenar os chunks na sessão
-        st.session_state["doc_chunks"] = documents
-        st.session_state["doc_hash"] = doc_hash
-        st.session_state["num_paginas"] = num_paginas
-        st.session_state["chunk_size_used"] = chunk_size
-        st.session_state["chunk_overlap_used"] = chunk_overlap
-        
-        # Criar índice vetorial se embeddings estiverem habilitados
-        index_created = False
-        if self.use_embeddings and self.embedding_model:
-            try:
-                self.vector_store = FAISS.from_documents(documents, self.embedding_model)
-                st.session_state["vector_store"] = self.vector_store
-                index_created = True
-                logger.info(f"Índice vetorial criado com {len(documents)} chunks")
-            except Exception as e:
-                logger.error(f"Erro ao criar índice vetorial: {e}")
-                self.use_embeddings = False
+        # O índice vetorial é criado só na primeira busca que precisar dele
+        # (perguntas de metadados, como número de páginas, não o usam)
+        self.embedding_matrix = None
         
         # Calcular estatísticas
         total_chars = sum(len(chunk) for chunk in chunks)
         avg_chunk_size = total_chars // len(chunks) if chunks else 0
         estimated_tokens = estimate_tokens(documento)
         
-        return {
+        resultado = {
             "total_chunks": len(chunks),
             "doc_hash": doc_hash,
-            "index_created": index_created,
+            "index_created": False,
             "tamanho_documento": len(documento),
             "num_paginas": num_paginas,
             "avg_chunk_size": avg_chunk_size,
@@ -138,6 +162,157 @@ class DocumentMemoryManager:
             "chunk_size": chunk_size,
             "chunk_overlap": chunk_overlap
         }
+        
+        # Armazenar os chunks na sessão
+        self._store_in_session(documents, resultado, None)
+        
+        cache[cache_key] = (documents, None, resultado)
+        while len(cache) > self.config.PROCESSING_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+        
+        return dict(resultado)
+    
+    def _store_in_session(
+        self,
+        documents: List[Document],
+        resultado: Dict[str, Any],
+        embedding_matrix: Optional[np.ndarray]
+    ):
+        """
+        Publica na sessão os chunks e o índice de um documento processado.
+        
+        Args:
+            documents: Chunks do documento
+            resultado: Metadados do processamento
+            embedding_matrix: Matriz de embeddings (None se não indexado)
+        """
+        st.session_state["doc_chunks"] = documents
+        st.session_state["doc_hash"] = resultado["doc_hash"]
+        st.session_state["num_paginas"] = resultado["num_paginas"]
+        st.session_state["chunk_size_used"] = resultado["chunk_size"]
+        st.session_state["chunk_overlap_used"] = resultado["chunk_overlap"]
+        
+        if embedding_matrix is not None:
+            st.session_state["embedding_matrix"] = embedding_matrix
+        else:
+            st.session_state.pop("embedding_matrix", None)
+    
+    def _build_embedding_matrix(self, chunks: List[str]) -> np.ndarray:
+        """
+        Gera a matriz de embeddings dos chunks, normalizada por linha.
+        
+        Os vetores ficam em um único array contíguo float32[n_chunks, dim],
+        de modo que a similaridade de cosseno com a consulta vira um único
+        produto matriz-vetor.
+        
+        Args:
+            chunks: Textos dos chunks
+            
+        Returns:
+            np.ndarray: Matriz float32 com uma linha por chunk
+        """
+        matriz = np.asarray(self.embedding_model.embed_documents(chunks), dtype=np.float32)
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        matriz /= normas
+        return np.ascontiguousarray(matriz)
+    
+    def _ensure_embedding_matrix(self, chunks: List[Document]) -> Optional[np.ndarray]:
+        """
+        Retorna a matriz de embeddings do documento atual, criando-a na
+        primeira chamada e guardando-a na sessão e no cache de processamento.
+        
+        Args:
+            chunks: Chunks do documento atual
+            
+        Returns:
+            np.ndarray ou None se os embeddings não estiverem disponíveis
+        """
+        matriz = st.session_state.get("embedding_matrix")
+        if matriz is not None:
+            return matriz
+        if not (self.use_embeddings and self.embedding_model):
+            return None
+        
+        try:
+            matriz = self._build_embedding_matrix([chunk.page_content for chunk in chunks])
+        except Exception as e:
+            logger.error(f"Erro ao criar índice vetorial: {e}")
+            self.use_embeddings = False
+            return None
+        logger.info(f"Índice vetorial criado com {len(chunks)} chunks")
+        
+        self.embedding_matrix = matriz
+        st.session_state["embedding_matrix"] = matriz
+        cache = st.session_state.get("_processamento_cache", {})
+        cache_key = st.session_state.get("_processamento_chave")
+        if cache_key in cache:
+            documents, _, resultado = cache[cache_key]
+            cache[cache_key] = (documents, matriz, dict(resultado, index_created=True))
+        return matriz
+    
+    def is_page_count_question(self, query: str) -> bool:
+        """
+        Indica se a pergunta é sobre o número de páginas (respondida pelos
+        metadados, sem busca).
+        
+        Args:
+            query: Consulta do usuário
+            
+        Returns:
+            bool: True se for uma pergunta sobre número de páginas
+        """
+        return bool(_PERGUNTA_PAGINAS_RE.search(query))
+    
+    def _embed_query_uncached(self, query: str) -> tuple:
+        """
+        Gera o embedding de uma consulta (use self._embed_query, que tem cache).
+        
+        Args:
+            query: Consulta do usuário
+            
+        Returns:
+            tuple: Vetor da consulta (tupla para poder ser memorizado)
+        """
+        return tuple(self.embedding_model.embed_query(query))
+    
+    def _vector_search(
+        self, 
+        query: str, 
+        chunks: List[Document], 
+        matriz: np.ndarray,
+        k: int
+    ) -> List[Document]:
+        """
+        Recupera os k chunks mais similares à consulta via produto matricial.
+        
+        Args:
+            query: Consulta do usuário
+            chunks: Lista de chunks (mesma ordem das linhas da matriz)
+            matriz: Matriz de embeddings normalizada
+            k: Número de chunks a retornar
+            
+        Returns:
+            list: Chunks mais similares, do mais para o menos relevante
+        """
+        q = np.asarray(self._embed_query(query), dtype=np.float32)
+        norma = np.linalg.norm(q)
+        if norma > 0:
+            q /= norma
+        
+        scores = matriz @ q
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        
+        # argpartition é O(n); só os k selecionados precisam ser ordenados
+        if k < len(scores):
+            top_idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top_idx = np.arange(len(scores))
+        top_idx = top_idx[np.argsort(-scores[top_idx])]
+        
+        return [chunks[i] for i in top_idx]
     
     def _count_pages(self, documento: str, tipo_documento: str) -> int:
         """
@@ -152,28 +327,18 @@ class DocumentMemoryManager:
         """
         # Para documentos PDF com informação explícita de páginas
         if tipo_documento == "Pdf":
-            # Buscar por padrões que indicam o número de páginas
-            page_patterns = [
-                r"Total de páginas:\s*(\d+)",
-                r"Páginas:\s*(\d+)",
-                r"(\d+)\s*páginas",
-                r"página\s*\d+\s*de\s*(\d+)",
-                r"--- Página\s+(\d+)\s+---"
-            ]
+            # Buscar por padrões que indicam o número de páginas e pegar o
+            # maior número encontrado em cada arquivo (cada match preenche um
+            # único grupo); com vários arquivos juntados, os totais se somam
+            total_paginas = 0
+            for secao in _ARQUIVO_RE.split(documento):
+                max_page = 0
+                for match in _PAGINAS_RE.finditer(secao):
+                    max_page = max(max_page, int(match.group(match.lastindex)))
+                total_paginas += max_page
             
-            max_page = 0
-            for pattern in page_patterns:
-                matches = re.findall(pattern, documento, re.IGNORECASE)
-                if matches:
-                    try:
-                        # Pegar o maior número encontrado
-                        page_nums = [int(m) for m in matches]
-                        max_page = max(max_page, max(page_nums))
-                    except ValueError:
-                        continue
-            
-            if max_page > 0:
-                return max_page
+            if total_paginas > 0:
+                return total_paginas
         
         # Estimativa baseada no número de caracteres
         # ~3000 caracteres por página é uma estimativa razoável
@@ -236,7 +401,7 @@ class DocumentMemoryManager:
         chunks = st.session_state["doc_chunks"]
         
         # Verificar se é uma pergunta sobre número de páginas
-        if re.search(r'quantas\s+p[áa]ginas|n[úu]mero\s+de\s+p[áa]ginas', query.lower()):
+        if self.is_page_count_question(query):
             if "num_paginas" in st.session_state:
                 num_paginas = st.session_state["num_paginas"]
                 metadata = {"source": "info", "num_paginas": num_paginas}
@@ -244,10 +409,10 @@ class DocumentMemoryManager:
                 return [Document(page_content=page_info, metadata=metadata)]
         
         # Usar busca vetorial se disponível
-        if self.use_embeddings and "vector_store" in st.session_state:
+        matriz = self._ensure_embedding_matrix(chunks)
+        if matriz is not None:
             try:
-                vector_store = st.session_state["vector_store"]
-                results = vector_store.similarity_search(query, k=k)
+                results = self._vector_search(query, chunks, matriz, k)
                 logger.info(f"Recuperados {len(results)} chunks usando busca vetorial")
                 return results
             except Exception as e:
@@ -275,7 +440,7 @@ class DocumentMemoryManager:
             list: Chunks mais relevantes
         """
         # Normalizar a consulta
-        query_norm = re.sub(r'[^\w\s]', '', query.lower())
+        query_norm = _PONTUACAO_RE.sub('', query.lower())
         keywords = [
             word for word in query_norm.split() 
             if word not in STOPWORDS_PT and len(word) > 2
@@ -322,6 +487,15 @@ class DocumentMemoryManager:
         
         return result_chunks
     
+    def get_full_document(self) -> str:
+        """
+        Retorna o texto completo do documento processado.
+        
+        Returns:
+            str: Conteúdo do documento (vazio se nenhum foi processado)
+        """
+        return self._documento
+    
     def get_document_preview(self, max_chars: int = 1500) -> str:
         """
         Gera um preview do documento para o contexto do modelo.
@@ -332,11 +506,10 @@ class DocumentMemoryManager:
         Returns:
             str: Preview do documento
         """
-        if "documento_completo" not in st.session_state:
+        documento = self.get_full_document()
+        if not documento:
             return "Documento não disponível"
         
-        documento = st.session_state["documento_completo"]
-        
         # Se o documento for menor que o limite, retorna completo
         if len(documento) <= max_chars:
             return documento
@@ -375,7 +548,7 @@ class DocumentMemoryManager:
             "chunk_size": st.session_state.get("chunk_size_used", self.config.DEFAULT_CHUNK_SIZE),
             "chunk_overlap": st.session_state.get("chunk_overlap_used", self.config.DEFAULT_CHUNK_OVERLAP),
             "doc_hash": st.session_state.get("doc_hash", ""),
-            "using_embeddings": self.use_embeddings and "vector_store" in st.session_state,
+            "using_embeddings": self.use_embeddings and "embedding_matrix" in st.session_state,
             "estimated_tokens": estimate_tokens(str(st.session_state.get("tamanho_documento", 0)))
         }
         return info
@@ -389,7 +562,7 @@ class DocumentMemoryManager:
         """
         stats = {
             "total_queries": st.session_state.get("total_queries", 0),
-            "using_vector_search": self.use_embeddings and "vector_store" in st.session_state,
+            "using_vector_search": self.use_embeddings and "embedding_matrix" in st.session_state,
             "avg_chunks_retrieved": st.session_state.get("avg_chunks_retrieved", 0)
         }
         return stats
@@ -402,3 +575,29 @@ class DocumentMemoryManager:
             logger.info("Arquivos temporários limpos")
         except Exception as e:
             logger.error(f"Erro ao limpar arquivos temporários: {e}")
+
+
+@st.cache_resource(show_spinner=False)
+def get_embedding_model(model_name: str, batch_size: int):
+    """
+    Carrega o modelo de embeddings uma única vez por processo.
+    
+    Usa o fastembed (ONNX Runtime, sem PyTorch) quando instalado e recorre
+    ao sentence-transformers caso contrário.
+    
+    Args:
+        model_name: Nome do modelo de embeddings
+        batch_size: Chunks processados por lote em embed_documents
+        
+    Returns:
+        Embeddings do LangChain (embed_documents / embed_query)
+    """
+    try:
+        return FastEmbedEmbeddings(model_name=model_name, batch_size=batch_size)
+    except ImportError:
+        logger.info("fastembed não instalado, usando sentence-transformers")
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True, 'batch_size': batch_size}
+        )
@@ -3,15 +3,17 @@ Módulo otimizado para carregamento de diferentes tipos de documentos.
 Implementa validação robusta, tratamento de erros e cache.
 """
 import os
+import io
+import csv
 import logging
 from time import sleep
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union, BinaryIO
+import docx2txt
+import pymupdf
 import streamlit as st
 from langchain_community.document_loaders import (
     WebBaseLoader,
     YoutubeLoader,
-    PyPDFLoader,
-    CSVLoader,
     TextLoader,
     Docx2txtLoader
 )
@@ -22,6 +24,7 @@ from utils import (
     validate_url,
     validate_youtube_url,
     calculate_file_hash,
+    calculate_stream_hash,
     create_cache_key,
     safe_session_state_get,
     safe_session_state_set
@@ -96,6 +99,60 @@ class DocumentLoader:
             logger.error(f"Erro ao salvar cache: {e}")
 
 
+def _valida_arquivo(origem: Union[str, BinaryIO]) -> Optional[str]:
+    """
+    Verifica se o arquivo existe e respeita o limite de tamanho.
+    
+    Args:
+        origem: Caminho do arquivo ou objeto de arquivo em memória
+        
+    Returns:
+        str: Mensagem de erro ou None se o arquivo for válido
+    """
+    if isinstance(origem, str):
+        if not os.path.exists(origem):
+            return f"❌ Arquivo não encontrado: {origem}"
+        file_size = os.path.getsize(origem)
+    else:
+        origem.seek(0, os.SEEK_END)
+        file_size = origem.tell()
+        origem.seek(0)
+    
+    if file_size > AppConfig.MAX_FILE_SIZE_BYTES:
+        return f"❌ Arquivo muito grande ({file_size / 1024 / 1024:.1f} MB). Limite: {AppConfig.MAX_FILE_SIZE_MB} MB"
+    
+    return None
+
+
+def _cache_key_arquivo(origem: Union[str, BinaryIO], tipo: str) -> Optional[str]:
+    """
+    Cria a chave do cache em disco de um arquivo a partir do hash do seu conteúdo.
+    
+    Uploads em memória não entram no cache em disco: o texto extraído não
+    deve ficar gravado no servidor, e o st.cache_data de carrega_arquivos
+    já os memoriza pelo hash calculado lá.
+    
+    Args:
+        origem: Caminho do arquivo ou objeto de arquivo em memória
+        tipo: Tipo do documento
+        
+    Returns:
+        str: Chave de cache, ou None para uploads em memória
+    """
+    if not isinstance(origem, str):
+        return None
+    with open(origem, 'rb') as f:
+        file_hash = calculate_stream_hash(f, AppConfig.IO_BUFFER_SIZE)
+    return f"{tipo}_{file_hash}"
+
+
+def _abre_pdf(origem: Union[str, bytes]) -> "pymupdf.Document":
+    """Abre um PDF a partir de um caminho ou dos seus bytes."""
+    if isinstance(origem, str):
+        return pymupdf.open(origem)
+    return pymupdf.open(stream=origem, filetype="pdf")
+
+
 def carrega_site(url: str, use_cache: bool = True) -> Tuple[str, str]:
     """
     Carrega o conteúdo de um site web com validação e cache.
@@ -204,43 +261,52 @@ def carrega_youtube(video_url: str, use_cache: bool = True) -> Tuple[str, str]:
         return "", error_msg
 
 
-def carrega_pdf(caminho: str, use_cache: bool = True) -> Tuple[str, str]:
+def carrega_pdf(caminho: Union[str, BinaryIO], use_cache: bool = True) -> Tuple[str, str]:
     """
-    Carrega o conteúdo de um arquivo PDF.
+    Carrega o conteúdo de um arquivo PDF usando o extrator de texto do PyMuPDF.
     
     Args:
-        caminho: Caminho para o arquivo PDF
+        caminho: Caminho para o arquivo PDF ou o arquivo já em memória
         use_cache: Se deve usar cache
         
     Returns:
         tuple: (conteúdo, mensagem de status)
     """
-    if not os.path.exists(caminho):
-        error_msg = f"❌ Arquivo não encontrado: {caminho}"
+    error_msg = _valida_arquivo(caminho)
+    if error_msg:
         logger.error(error_msg)
         return "", error_msg
     
-    # Verificar tamanho do arquivo
-    file_size = os.path.getsize(caminho)
-    if file_size > AppConfig.MAX_FILE_SIZE_BYTES:
-        error_msg = f"❌ Arquivo muito grande ({file_size / 1024 / 1024:.1f} MB). Limite: {AppConfig.MAX_FILE_SIZE_MB} MB"
-        logger.error(error_msg)
-        return "", error_msg
+    # Verificar cache
+    loader = DocumentLoader()
+    cache_key = _cache_key_arquivo(caminho, "Pdf")
+    
+    if use_cache and cache_key:
+        cached_content = loader._get_from_cache(cache_key)
+        if cached_content:
+            return cached_content, "✅ Carregado do cache"
     
     try:
-        pdf_loader = PyPDFLoader(caminho)
-        lista_documentos = pdf_loader.load()
+        # Arquivos em memória são abertos direto dos bytes, sem arquivo temporário
+        origem = caminho if isinstance(caminho, str) else caminho.read()
+        
+        with _abre_pdf(origem) as pdf:
+            paginas = [pagina.get_text("text") for pagina in pdf]
         
         # Adicionar informação de páginas
-        num_paginas = len(lista_documentos)
+        num_paginas = len(paginas)
         documento = f"Total de páginas: {num_paginas}\n\n"
-        documento += '\n\n'.join([f"--- Página {i+1} ---\n{doc.page_content}" 
-                                  for i, doc in enumerate(lista_documentos)])
+        documento += '\n\n'.join([f"--- Página {i+1} ---\n{texto}" 
+                                  for i, texto in enumerate(paginas)])
         
         if not documento or documento.strip() == '':
             raise ValueError("O PDF parece estar vazio ou não foi possível extrair texto")
         
-        logger.info(f"PDF carregado: {caminho} ({num_paginas} páginas)")
+        # Salvar no cache
+        if cache_key:
+            loader._save_to_cache(cache_key, documento)
+        
+        logger.info(f"PDF carregado: {getattr(caminho, 'name', caminho)} ({num_paginas} páginas)")
         return documento, f"✅ PDF carregado ({num_paginas} páginas, {len(documento)} caracteres)"
         
     except Exception as e:
@@ -249,38 +315,48 @@ def carrega_pdf(caminho: str, use_cache: bool = True) -> Tuple[str, str]:
         return "", error_msg
 
 
-def carrega_docx(caminho: str, use_cache: bool = True) -> Tuple[str, str]:
+def carrega_docx(caminho: Union[str, BinaryIO], use_cache: bool = True) -> Tuple[str, str]:
     """
     Carrega o conteúdo de um arquivo Word (DOCX).
     
     Args:
-        caminho: Caminho para o arquivo DOCX
+        caminho: Caminho para o arquivo DOCX ou o arquivo já em memória
         use_cache: Se deve usar cache
         
     Returns:
         tuple: (conteúdo, mensagem de status)
     """
-    if not os.path.exists(caminho):
-        error_msg = f"❌ Arquivo não encontrado: {caminho}"
+    error_msg = _valida_arquivo(caminho)
+    if error_msg:
         logger.error(error_msg)
         return "", error_msg
     
-    # Verificar tamanho do arquivo
-    file_size = os.path.getsize(caminho)
-    if file_size > AppConfig.MAX_FILE_SIZE_BYTES:
-        error_msg = f"❌ Arquivo muito grande ({file_size / 1024 / 1024:.1f} MB). Limite: {AppConfig.MAX_FILE_SIZE_MB} MB"
-        logger.error(error_msg)
-        return "", error_msg
+    # Verificar cache
+    loader = DocumentLoader()
+    cache_key = _cache_key_arquivo(caminho, "Docx")
+    
+    if use_cache and cache_key:
+        cached_content = loader._get_from_cache(cache_key)
+        if cached_content:
+            return cached_content, "✅ Carregado do cache"
     
     try:
-        docx_loader = Docx2txtLoader(caminho)
-        lista_documentos = docx_loader.load()
-        documento = '\n\n'.join([doc.page_content for doc in lista_documentos])
+        if isinstance(caminho, str):
+            docx_loader = Docx2txtLoader(caminho)
+            lista_documentos = docx_loader.load()
+            documento = '\n\n'.join([doc.page_content for doc in lista_documentos])
+        else:
+            # docx2txt lê direto do objeto de arquivo, sem passar pelo disco
+            documento = docx2txt.process(caminho)
         
         if not documento or documento.strip() == '':
             raise ValueError("O arquivo Word parece estar vazio ou não foi possível extrair texto")
         
-        logger.info(f"DOCX carregado: {caminho}")
+        # Salvar no cache
+        if cache_key:
+            loader._save_to_cache(cache_key, documento)
+        
+        logger.info(f"DOCX carregado: {getattr(caminho, 'name', caminho)}")
         return documento, f"✅ Word carregado ({len(documento)} caracteres)"
         
     except Exception as e:
@@ -289,41 +365,106 @@ def carrega_docx(caminho: str, use_cache: bool = True) -> Tuple[str, str]:
         return "", error_msg
 
 
-def carrega_csv(caminho: str, use_cache: bool = True) -> Tuple[str, str]:
+def _decodifica_em_memoria(arquivo: BinaryIO, encoding: str = 'utf-8') -> str:
+    """
+    Decodifica um arquivo em memória de uma só vez.
+    
+    Para BytesIO (como o UploadedFile do Streamlit) decodifica direto do
+    buffer interno, sem a cópia em bytes feita por read().
+    
+    Args:
+        arquivo: Arquivo binário em memória
+        encoding: Codificação do texto
+        
+    Returns:
+        str: Conteúdo decodificado
+    """
+    if isinstance(arquivo, io.BytesIO):
+        with arquivo.getbuffer() as buffer:
+            return str(buffer, encoding)
+    arquivo.seek(0)
+    return arquivo.read().decode(encoding)
+
+
+def _formata_linha_csv(linha: Dict) -> str:
+    """
+    Formata uma linha do CSV no mesmo formato do CSVLoader do LangChain
+    (um "coluna: valor" por linha).
+    
+    Args:
+        linha: Linha lida pelo csv.DictReader
+        
+    Returns:
+        str: Linha formatada
+    """
+    partes = []
+    for coluna, valor in linha.items():
+        if isinstance(valor, list):  # valores excedentes, sem cabeçalho
+            valor = ','.join(v.strip() for v in valor)
+        elif isinstance(valor, str):
+            valor = valor.strip()
+        partes.append(f"{coluna.strip() if coluna is not None else coluna}: {valor}")
+    return "\n".join(partes)
+
+
+def _le_linhas_csv(origem: Union[str, BinaryIO]) -> List[str]:
+    """
+    Lê as linhas de um CSV a partir de um caminho ou de um arquivo em memória.
+    
+    Args:
+        origem: Caminho do arquivo ou objeto de arquivo binário
+        
+    Returns:
+        list: Linhas formatadas
+    """
+    if isinstance(origem, str):
+        with open(origem, newline='', encoding='utf-8') as arquivo:
+            return [_formata_linha_csv(linha) for linha in csv.DictReader(arquivo)]
+    
+    texto = io.StringIO(_decodifica_em_memoria(origem), newline='')
+    return [_formata_linha_csv(linha) for linha in csv.DictReader(texto)]
+
+
+def carrega_csv(caminho: Union[str, BinaryIO], use_cache: bool = True) -> Tuple[str, str]:
     """
     Carrega o conteúdo de um arquivo CSV.
     
     Args:
-        caminho: Caminho para o arquivo CSV
+        caminho: Caminho para o arquivo CSV ou o arquivo já em memória
         use_cache: Se deve usar cache
         
     Returns:
         tuple: (conteúdo, mensagem de status)
     """
-    if not os.path.exists(caminho):
-        error_msg = f"❌ Arquivo não encontrado: {caminho}"
+    error_msg = _valida_arquivo(caminho)
+    if error_msg:
         logger.error(error_msg)
         return "", error_msg
     
-    # Verificar tamanho do arquivo
-    file_size = os.path.getsize(caminho)
-    if file_size > AppConfig.MAX_FILE_SIZE_BYTES:
-        error_msg = f"❌ Arquivo muito grande ({file_size / 1024 / 1024:.1f} MB). Limite: {AppConfig.MAX_FILE_SIZE_MB} MB"
-        logger.error(error_msg)
-        return "", error_msg
+    # Verificar cache
+    loader = DocumentLoader()
+    cache_key = _cache_key_arquivo(caminho, "Csv")
+    
+    if use_cache and cache_key:
+        cached_content = loader._get_from_cache(cache_key)
+        if cached_content:
+            return cached_content, "✅ Carregado do cache"
     
     try:
-        csv_loader = CSVLoader(caminho, encoding='utf-8')
-        lista_documentos = csv_loader.load()
-        documento = '\n\n'.join([doc.page_content for doc in lista_documentos])
+        linhas = _le_linhas_csv(caminho)
+        documento = '\n\n'.join(linhas)
         
         if not documento or documento.strip() == '':
             raise ValueError("O CSV parece estar vazio ou não foi possível extrair dados")
         
         # Contar linhas
-        num_linhas = len(lista_documentos)
+        num_linhas = len(linhas)
+        
+        # Salvar no cache
+        if cache_key:
+            loader._save_to_cache(cache_key, documento)
         
-        logger.info(f"CSV carregado: {caminho} ({num_linhas} linhas)")
+        logger.info(f"CSV carregado: {getattr(caminho, 'name', caminho)} ({num_linhas} linhas)")
         return documento, f"✅ CSV carregado ({num_linhas} linhas, {len(documento)} caracteres)"
         
     except Exception as e:
@@ -332,38 +473,47 @@ def carrega_csv(caminho: str, use_cache: bool = True) -> Tuple[str, str]:
         return "", error_msg
 
 
-def carrega_txt(caminho: str, use_cache: bool = True) -> Tuple[str, str]:
+def carrega_txt(caminho: Union[str, BinaryIO], use_cache: bool = True) -> Tuple[str, str]:
     """
     Carrega o conteúdo de um arquivo TXT.
     
     Args:
-        caminho: Caminho para o arquivo TXT
+        caminho: Caminho para o arquivo TXT ou o arquivo já em memória
         use_cache: Se deve usar cache
         
     Returns:
         tuple: (conteúdo, mensagem de status)
     """
-    if not os.path.exists(caminho):
-        error_msg = f"❌ Arquivo não encontrado: {caminho}"
+    error_msg = _valida_arquivo(caminho)
+    if error_msg:
         logger.error(error_msg)
         return "", error_msg
     
-    # Verificar tamanho do arquivo
-    file_size = os.path.getsize(caminho)
-    if file_size > AppConfig.MAX_FILE_SIZE_BYTES:
-        error_msg = f"❌ Arquivo muito grande ({file_size / 1024 / 1024:.1f} MB). Limite: {AppConfig.MAX_FILE_SIZE_MB} MB"
-        logger.error(error_msg)
-        return "", error_msg
+    # Verificar cache
+    loader = DocumentLoader()
+    cache_key = _cache_key_arquivo(caminho, "Txt")
+    
+    if use_cache and cache_key:
+        cached_content = loader._get_from_cache(cache_key)
+        if cached_content:
+            return cached_content, "✅ Carregado do cache"
     
     try:
-        txt_loader = TextLoader(caminho, encoding='utf-8')
-        lista_documentos = txt_loader.load()
-        documento = '\n\n'.join([doc.page_content for doc in lista_documentos])
+        if isinstance(caminho, str):
+            txt_loader = TextLoader(caminho, encoding='utf-8')
+            lista_documentos = txt_loader.load()
+            documento = '\n\n'.join([doc.page_content for doc in lista_documentos])
+        else:
+            documento = _decodifica_em_memoria(caminho)
         
         if not documento or documento.strip() == '':
             raise ValueError("O arquivo de texto parece estar vazio")
         
-        logger.info(f"TXT carregado: {caminho}")
+        # Salvar no cache
+        if cache_key:
+            loader._save_to_cache(cache_key, documento)
+        
+        logger.info(f"TXT carregado: {getattr(caminho, 'name', caminho)}")
         return documento, f"✅ Texto carregado ({len(documento)} caracteres)"
         
     except Exception as e:
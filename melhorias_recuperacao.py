@@ -7,7 +7,9 @@ from langchain.schema import Document
 import streamlit as st
 import logging
 
+from config import AppConfig
 from diagnostico import DocumentDiagnostic
+from utils import truncate_to_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -90,15 +92,20 @@ Use essas informações para responder sobre a estrutura geral do documento.
             
             if numero_cap and self.estrutura:
                 # Tentar extrair o capítulo completo
-                documento = st.session_state.get('documento_completo', '')
+                doc_manager = st.session_state.get('doc_memory_manager')
+                documento = doc_manager.get_full_document() if doc_manager else ''
                 conteudo_cap = self.diagnostico.extrair_capitulo_especifico(
                     documento, numero_cap, self.estrutura
                 )
                 
                 if conteudo_cap and not conteudo_cap.startswith("Capítulo"):
+                    # Limitar por tokens para não exceder o contexto do modelo
+                    conteudo_cap = truncate_to_tokens(
+                        conteudo_cap, AppConfig.MAX_CHAPTER_TOKENS
+                    )
                     contexto_adicional = f"""
 CONTEÚDO COMPLETO DO CAPÍTULO {numero_cap}:
-{conteudo_cap[:5000]}  # Limitar para não exceder tokens
+{conteudo_cap}
 
 Use ESTE conteúdo para responder sobre o capítulo {numero_cap}.
 """
@@ -298,12 +305,12 @@ def integrar_smart_retriever():
     Integra o SmartRetriever no sistema existente.
     Adicione esta função no app.py após carregar o documento.
     """
-    if 'documento_completo' not in st.session_state:
+    if st.session_state.get('doc_memory_manager') is None:
         return None
     
     if 'smart_retriever' not in st.session_state:
         retriever = SmartRetriever()
-        documento = st.session_state['documento_completo']
+        documento = st.session_state['doc_memory_manager'].get_full_document()
         
         # Inicializar
         info = retriever.initialize_with_document(documento)
@@ -5,10 +5,16 @@ import hashlib
 import re
 import os
 import logging
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, BinaryIO, List
 from urllib.parse import urlparse
 import streamlit as st
 
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken vem com langchain-openai
+    tiktoken = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -57,13 +63,42 @@ def calculate_file_hash(content: str) -> str:
     """
     Calcula o hash MD5 de um conteúdo.
     
+    Textos grandes são codificados em blocos, sem criar uma cópia em bytes
+    do documento inteiro (o resultado é o mesmo).
+    
     Args:
         content: Conteúdo para calcular hash
         
     Returns:
         str: Hash MD5 em hexadecimal
     """
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
+    bloco = 1024 * 1024
+    if len(content) <= bloco:
+        return hashlib.md5(content.encode('utf-8')).hexdigest()
+    
+    md5 = hashlib.md5()
+    for inicio in range(0, len(content), bloco):
+        md5.update(content[inicio:inicio + bloco].encode('utf-8'))
+    return md5.hexdigest()
+
+
+def calculate_stream_hash(stream: BinaryIO, chunk_size: int = 64 * 1024) -> str:
+    """
+    Calcula o hash MD5 de um arquivo aberto, lendo em blocos.
+    
+    Args:
+        stream: Objeto de arquivo binário (ex: upload do Streamlit)
+        chunk_size: Tamanho de cada bloco lido
+        
+    Returns:
+        str: Hash MD5 em hexadecimal
+    """
+    file_hash = hashlib.md5()
+    stream.seek(0)
+    for bloco in iter(lambda: stream.read(chunk_size), b''):
+        file_hash.update(bloco)
+    stream.seek(0)
+    return file_hash.hexdigest()
 
 
 def format_file_size(size_bytes: int) -> str:
@@ -97,6 +132,92 @@ def estimate_tokens(text: str) -> int:
     return len(text) // 4
 
 
+@lru_cache(maxsize=1)
+def _get_token_encoding():
+    """Carrega (uma única vez) o tokenizer usado para contar tokens."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer indisponível, usando estimativa por caracteres: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Conta os tokens de um texto com o tiktoken, ou estima (1 token ≈ 4
+    caracteres) se o tokenizer não estiver disponível.
+    
+    Args:
+        text: Texto para contar
+        
+    Returns:
+        int: Número de tokens
+    """
+    encoding = _get_token_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_token_ids(text: str) -> List[int]:
+    """
+    Tokeniza um texto com o tiktoken, para contagem local de tokens.
+    
+    Usado como custom_get_token_ids dos modelos do LangChain: sem ele,
+    provedores que não sobrescrevem a contagem (ex: Groq) recorrem ao
+    tokenizer GPT-2 do transformers, que não é dependência do projeto.
+    Sem o tiktoken, devolve ids fictícios na quantidade de estimate_tokens.
+    
+    Args:
+        text: Texto para tokenizar
+        
+    Returns:
+        list: Ids dos tokens
+    """
+    encoding = _get_token_encoding()
+    if encoding is None:
+        return list(range(estimate_tokens(text)))
+    return encoding.encode(text, disallowed_special=())
+
+
+def truncate_to_tokens(text: str, max_tokens: int, head_ratio: float = 0.75) -> str:
+    """
+    Trunca um texto por número de tokens, preservando início e fim.
+    
+    Usa o tokenizer do tiktoken quando disponível; caso contrário recorre
+    à mesma aproximação de estimate_tokens (1 token ≈ 4 caracteres).
+    
+    Args:
+        text: Texto para truncar
+        max_tokens: Número máximo de tokens do resultado
+        head_ratio: Fração dos tokens reservada para o início do texto
+        
+    Returns:
+        str: Texto original ou versão truncada com marcador no meio
+    """
+    marcador = "\n\n[...]\n\n"
+    head_tokens = int(max_tokens * head_ratio)
+    tail_tokens = max_tokens - head_tokens
+    
+    encoding = _get_token_encoding()
+    if encoding is None:
+        if estimate_tokens(text) <= max_tokens:
+            return text
+        head = text[:head_tokens * 4]
+        tail = text[-tail_tokens * 4:] if tail_tokens > 0 else ""
+        return f"{head}{marcador}{tail}"
+    
+    ids = encoding.encode(text, disallowed_special=())
+    if len(ids) <= max_tokens:
+        return text
+    
+    head = encoding.decode(ids[:head_tokens])
+    tail = encoding.decode(ids[-tail_tokens:]) if tail_tokens > 0 else ""
+    return f"{head}{marcador}{tail}"
+
+
 def estimate_cost(tokens: int, provider: str, model: str) -> Dict[str, float]:
     """
     Estima o custo de uso de tokens.
@@ -252,6 +373,22 @@ def validate_api_key(api_key: str, provider: str) -> tuple[bool, str]:
     return True, "API key válida"
 
 
+def minify_css(css: str) -> str:
+    """
+    Remove comentários e espaços desnecessários de um bloco de CSS.
+    
+    Args:
+        css: CSS original (pode incluir as tags <style>)
+        
+    Returns:
+        str: CSS compactado
+    """
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};:,>])\s*', r'\1', css)
+    return css.strip()
+
+
 def format_document_info(info: Dict[str, Any]) -> str:
     """
     Formata informações do documento para exibição.